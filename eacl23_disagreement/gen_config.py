@@ -2,6 +2,7 @@
 """Generate MaChAmp dataset configs."""
 
 import argparse
+import copy
 import json
 import os
 
@@ -46,7 +47,7 @@ def main():
     )
     args = parser.parse_args()
 
-    config = json.loads(json.dumps(TEMPLATE))
+    config = copy.deepcopy(TEMPLATE)
     config["MD"]["train_data_path"] = os.path.join(args.split_dir, "train.tsv")
     config["MD"]["dev_data_path"] = os.path.join(args.split_dir, "dev.tsv")
     config["MD"]["test_data_path"] = os.path.join(args.split_dir, "test.tsv")
@@ -2,9 +2,12 @@
 """Create training variants for disagreement experiments."""
 
 import argparse
+import contextlib
 import os
 import shutil
 
+WRITE_BUFFER = 1 << 20
+
 
 def read_tsv(path):
     with open(path, encoding="utf8") as handle:
@@ -15,20 +18,48 @@ def read_tsv(path):
             yield parts
 
 
-def write_tsv(path, rows):
-    os.makedirs(os.path.dirname(path), exist_ok=True)
-    with open(path, "w", encoding="utf8") as handle:
-        for row in rows:
-            handle.write("\t".join(row) + "\n")
-
-
 def _norm(value):
     return (value or "").strip().lower().replace(" ", "_")
 
 
-def cat_is(row, key):
-    category = _norm(row[4] if len(row) > 4 else "")
-    return category == _norm(key)
+VARIANTS = ("App", "App_A0all", "App_A0_SUBJ", "App_A0_MISS", "App_A0_AMB")
+
+APP_LEVELS = {"A++", "A+"}
+
+A0_VARIANTS = {
+    _norm("Subjectivity"): ("App_A0all", "App_A0_SUBJ"),
+    _norm("Missing_Info"): ("App_A0all", "App_A0_MISS"),
+    _norm("Ambiguity"): ("App_A0all", "App_A0_AMB"),
+}
+
+
+def variant_names(row):
+    """Return the training variants (Sec. 5.2) that include ``row``."""
+    if row[2] in APP_LEVELS:
+        return VARIANTS
+    if row[2] == "A0":
+        return A0_VARIANTS.get(_norm(row[4]), ("App_A0all",))
+    return ("App_A0all",)
+
+
+def write_variants(rows, out_root):
+    """Stream ``rows`` into each variant's train.tsv and return the row counts."""
+    counts = dict.fromkeys(VARIANTS, 0)
+    with contextlib.ExitStack() as stack:
+        handles = {}
+        for name in VARIANTS:
+            path = os.path.join(out_root, name, "train.tsv")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            handles[name] = stack.enter_context(
+                open(path, "w", encoding="utf8", buffering=WRITE_BUFFER)
+            )
+
+        for row in rows:
+            line = "\t".join(row) + "\n"
+            for name in variant_names(row):
+                handles[name].write(line)
+                counts[name] += 1
+    return counts
 
 
 def main():
@@ -37,38 +68,15 @@ def main():
     parser.add_argument("--out_root", default="data/splits")
     args = parser.parse_args()
 
-    train_rows = list(read_tsv(os.path.join(args.base_dir, "train.tsv")))
-
-    is_App = lambda row: row[2] in {"A++", "A+"}
-    is_A0 = lambda row: row[2] == "A0"
-
-    variants = {
-        "App": [row for row in train_rows if is_App(row)],
-        "App_A0all": train_rows[:],
-        "App_A0_SUBJ": [
-            row
-            for row in train_rows
-            if is_App(row) or (is_A0(row) and cat_is(row, "Subjectivity"))
-        ],
-        "App_A0_MISS": [
-            row
-            for row in train_rows
-            if is_App(row) or (is_A0(row) and cat_is(row, "Missing_Info"))
-        ],
-        "App_A0_AMB": [
-            row
-            for row in train_rows
-            if is_App(row) or (is_A0(row) and cat_is(row, "Ambiguity"))
-        ],
-    }
-
-    for name, rows in variants.items():
+    counts = write_variants(
+        read_tsv(os.path.join(args.base_dir, "train.tsv")), args.out_root
+    )
+
+    for name in VARIANTS:
         out_dir = os.path.join(args.out_root, name)
-        write_tsv(os.path.join(out_dir, "train.tsv"), rows)
-        os.makedirs(out_dir, exist_ok=True)
         shutil.copy2(os.path.join(args.base_dir, "dev.tsv"), os.path.join(out_dir, "dev.tsv"))
         shutil.copy2(os.path.join(args.base_dir, "test.tsv"), os.path.join(out_dir, "test.tsv"))
-        print(name, "train_size:", len(rows))
+        print(name, "train_size:", counts[name])
 
 
 if __name__ == "__main__":
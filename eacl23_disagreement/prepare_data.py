@@ -2,13 +2,21 @@
 """Normalize MD-Agreement data for MaChAmp."""
 
 import argparse
+import functools
+import numpy as np
 import pandas as pd
 import os
 import re
 import csv
-from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 
 
+WRITE_BUFFER = 1 << 20
+
+WRITE_BATCH = 8192
+
+
+@functools.lru_cache(maxsize=None)
 def _sniff_sep(path):
     """Heuristically choose delimiter for CSV/TSV files."""
     with open(path, "r", encoding="utf8", newline="") as f:
@@ -18,39 +26,57 @@ def _sniff_sep(path):
     return ","
 
 
+OFF = "OFF"
+
+NOT = "NOT"
+
+NORM_OFF = {
+    "off": OFF,
+    "offensive": OFF,
+    "1": OFF,
+    "true": OFF,
+    "toxic": OFF,
+    "not": NOT,
+    "non-offensive": NOT,
+    "0": NOT,
+    "false": NOT,
+    "clean": NOT,
+    "none": NOT,
+}
+
+
 def _norm_off(label):
     """Normalize offensive labels to OFF/NOT."""
-    label = str(label).strip().lower()
-    if label in {"off", "offensive", "1", "true", "toxic"}:
-        return "OFF"
-    if label in {"not", "non-offensive", "0", "false", "clean", "none"}:
-        return "NOT"
-    raise ValueError(f"Unrecognized label: {label}")
-
-
-def _majority_and_agreement(labels):
-    """Derive majority offensive label and agreement tier."""
-    if len(labels) != 5:
-        raise ValueError(
-            f"Expected 5 annotator labels to derive majority/agreement, got {labels}"
-        )
+    label = label.strip().lower()
+    try:
+        return NORM_OFF[label]
+    except KeyError:
+        raise ValueError(f"Unrecognized label: {label}") from None
 
-    counts = Counter(labels)
-    majority_label, majority_votes = counts.most_common(1)[0]
-    if majority_votes == 5:
-        agreement = "A++"
-    elif majority_votes == 4:
-        agreement = "A+"
-    elif majority_votes == 3:
-        agreement = "A0"
-    else:
-        raise ValueError(f"Unexpected vote distribution: {counts}")
-    return majority_label, agreement
+
+# Indexed by the number of OFF votes + 1, so rows without votes (-1) map to "".
+MAJORITY_BY_OFF_VOTES = np.array(["", NOT, NOT, NOT, OFF, OFF, OFF], dtype=object)
+
+AGREEMENT_BY_OFF_VOTES = np.array(
+    ["", "A++", "A+", "A0", "A0", "A+", "A++"], dtype=object
+)
+
+
+def _majority_and_agreement(off_votes):
+    """Derive majority labels and agreement tiers from per-row OFF vote counts.
+
+    Rows without annotator labels carry a count of -1 and get empty strings.
+    """
+    index = np.asarray(off_votes, dtype=np.intp) + 1
+    return MAJORITY_BY_OFF_VOTES[index], AGREEMENT_BY_OFF_VOTES[index]
 
 
 ID_DIGITS = re.compile(r"^(\d+)")
 
-ANNOT_SPLIT = re.compile(r"[;,/\\|\s]+")
+SPLIT_SUFFIX = re.compile(r"[-_]([^-_]+)$")
+
+# Maps annotation separators to spaces so str.split() can split on them.
+ANNOT_SEPARATORS = str.maketrans(";,/\\|", "     ")
 
 VALID_SPLITS = {"train", "dev", "test"}
 
@@ -68,34 +94,28 @@ SPLIT_ALIASES = {
 def _normalize_split_name(value):
     if value is None:
         return ""
-    normalized = str(value).strip().lower()
+    normalized = value.strip().lower()
     if not normalized:
         return ""
     mapped = SPLIT_ALIASES.get(normalized, normalized)
     return mapped if mapped in VALID_SPLITS else ""
 
 
+@functools.lru_cache(maxsize=65536)
 def _split_identifier(identifier):
     """Return (numeric_id, split_name) parsed from raw identifier."""
 
-    if identifier is None:
-        return "", ""
-
-    text = str(identifier).strip()
+    text = identifier.strip()
+    if text.isdigit():
+        return text, ""
     if not text:
         return "", ""
 
     match = ID_DIGITS.match(text)
     base = match.group(1) if match else text
 
-    split = ""
-    for sep in ("_", "-"):
-        if sep in text:
-            candidate = text.rsplit(sep, 1)[1]
-            split = _normalize_split_name(candidate)
-            if split:
-                break
-            split = ""
+    match = SPLIT_SUFFIX.search(text)
+    split = _normalize_split_name(match.group(1)) if match else ""
 
     return base, split
 
@@ -108,10 +128,7 @@ def _id_base(identifier):
 def _parse_annotation_sequence(value):
     """Parse comma/space separated annotator labels from a single field."""
 
-    if value is None:
-        return []
-
-    text = str(value).strip()
+    text = value.strip()
     if not text:
         return []
 
@@ -120,52 +137,116 @@ def _parse_annotation_sequence(value):
     if not text:
         return []
 
-    parts = [part for part in ANNOT_SPLIT.split(text) if part]
+    parts = text.translate(ANNOT_SEPARATORS).split()
     if len(parts) <= 1:
         return []
 
     return [_norm_off(part) for part in parts]
 
 
-def _collect_votes(row, annotator_cols=None, annotations_field=None):
-    """Collect annotator votes either from dedicated columns or a single field."""
+def _column(frame, name):
+    """Return column ``name`` of ``frame``, or empty strings if it is absent."""
+    if name and name in frame:
+        return frame[name]
+    return pd.Series("", index=frame.index, dtype=object)
+
+
+def _map_unique(series, func):
+    """Apply ``func`` once per distinct value of ``series``."""
+    mapping = {value: func(value) for value in series.unique()}
+    return series.map(mapping)
+
+
+def _count_off_votes(value, source):
+    """Count OFF votes in an annotation sequence; -1 if there is none."""
+    votes = _parse_annotation_sequence(value)
+    if not votes:
+        return -1
+    if len(votes) != 5:
+        raise ValueError(f"Expected 5 annotator labels in '{source}', got {votes}")
+    return votes.count(OFF)
+
+
+def _collect_votes(frame, annotator_cols=None, annotations_field=None):
+    """Count OFF annotator votes per row from dedicated columns or a single field."""
 
     if annotator_cols:
-        votes = []
+        if len(annotator_cols) != 5:
+            raise ValueError(
+                f"Expected 5 annotator columns to derive majority/agreement, got {annotator_cols}"
+            )
+        off_votes = np.zeros(len(frame), dtype=np.int8)
         for col in annotator_cols:
-            if col not in row or row[col] is None or str(row[col]).strip() == "":
+            if col not in frame:
+                raise ValueError(f"Missing annotator column '{col}'")
+            values = frame[col].str.strip()
+            missing = values == ""
+            if missing.any():
+                row = frame[missing].iloc[0].to_dict()
                 raise ValueError(f"Missing annotator column '{col}' in row {row}")
-            votes.append(_norm_off(row[col]))
-        return votes
+            off_votes += (_map_unique(values, _norm_off) == OFF).to_numpy()
+        return off_votes
 
     if annotations_field:
-        return _parse_annotation_sequence(row.get(annotations_field))
+        counts = _map_unique(
+            _column(frame, annotations_field),
+            lambda value: _count_off_votes(value, annotations_field),
+        )
+        return counts.to_numpy(dtype=np.int8)
+
+    return np.full(len(frame), -1, dtype=np.int8)
+
+
+TAXONOMY_FIELDS = (
+    "text",
+    "agr",
+    "primary_cat",
+    "primary_subcat",
+    "secondary_cat",
+    "secondary_subcat",
+)
+
+EMPTY_TAXONOMY = ("",) * len(TAXONOMY_FIELDS)
+
+# Category_dataset.tsv columns holding TAXONOMY_FIELDS, in the same order.
+TAXONOMY_COLUMNS = (
+    "Text",
+    "Agreement_level",
+    "Primary_category",
+    "Primary_subcategry",
+    "Secondary_category",
+    "Seconday_subcategory",
+)
+
 
-    return []
+_INTERNED = {}
+
+
+def _intern(value):
+    """Return a shared instance of ``value`` for small, repetitive vocabularies."""
+    return _INTERNED.setdefault(value, value)
 
 
 def load_taxonomy(tax_path):
-    """Load taxonomy annotations from Category_dataset.tsv."""
+    """Load taxonomy annotations from Category_dataset.tsv.
+
+    Entries are tuples ordered as ``TAXONOMY_FIELDS``. IDs carrying a split
+    suffix are keyed ``"<id>|<split>"``; IDs without one are keyed by the bare
+    ID and serve as the fallback for every split.
+    """
     if not tax_path or not os.path.exists(tax_path):
         return {}
 
     taxonomy = {}
-    df = pd.read_csv(tax_path, delimiter="\t", header=0)
-    for _, row in df.iterrows():
-        base_id, split = _split_identifier(row.get("ID"))
+    df = pd.read_csv(tax_path, delimiter="\t", header=0, dtype=str).fillna("")
+    columns = [_column(df, name).str.strip() for name in TAXONOMY_COLUMNS]
+    for identifier, text, *labels in zip(_column(df, "ID"), *columns):
+        base_id, split = _split_identifier(identifier)
         if not base_id:
             continue
 
-        key = (base_id, split or None)
-        row = row.fillna("")
-        taxonomy[key] = {
-            "text": (row.get("Text") or "").strip(),
-            "agr": (row.get("Agreement_level") or "").strip(),
-            "primary_cat": (row.get("Primary_category") or "").strip(),
-            "primary_subcat": (row.get("Primary_subcategry") or "").strip(),
-            "secondary_cat": (row.get("Secondary_category") or "").strip(),
-            "secondary_subcat": (row.get("Seconday_subcategory") or "").strip(),
-        }
+        key = f"{base_id}|{split}" if split else base_id
+        taxonomy[key] = (text, *map(_intern, labels))
     return taxonomy
 
 
@@ -188,95 +269,79 @@ def process_split(
 
     expected_split = _normalize_split_name(expected_split)
 
-    def lookup_taxonomy(base_id, split_name):
-        if not base_id:
-            return {}
+    print(in_path)
+    frame = pd.read_csv(
+        in_path,
+        delimiter=delimiter,
+        quoting=csv.QUOTE_NONE,
+        dtype=str,
+        keep_default_na=False,
+    )
 
-        key_specific = (base_id, split_name or None)
-        if key_specific in taxonomy:
-            return taxonomy[key_specific]
+    identifiers = _column(frame, id_col).map(_split_identifier)
+    tweet_ids = identifiers.str[0]
+    row_split = identifiers.str[1]
+    if expected_split:
+        keep = (row_split == "") | (row_split == expected_split)
+        frame, tweet_ids, row_split = frame[keep], tweet_ids[keep], row_split[keep]
+        row_split = row_split.where(row_split != "", expected_split)
 
-        if split_name:
-            fallback_key = (base_id, None)
-            return taxonomy.get(fallback_key, {})
+    text = _column(frame, text_col).str.replace("\n", " ", regex=False).str.strip()
 
-        return {}
+    derived_offensive, derived_agreement = _majority_and_agreement(
+        _collect_votes(frame, ann_cols, ann_field)
+    )
 
-    with open(in_path, encoding="utf8", newline="") as in_handle, open(
-        out_path, "w", encoding="utf8"
-    ) as out_handle:
-        print(in_path)
-        reader = pd.read_csv(in_path, delimiter=delimiter, quoting=csv.QUOTE_NONE)
-        for _, row in reader.iterrows():
-            tweet_id, row_split = _split_identifier(row.get(id_col))
-            if expected_split:
-                if row_split and row_split != expected_split:
-                    continue
-                row_split = row_split or expected_split
-
-            text = (row.get(text_col) or "").replace("\n", " ").strip()
-
-            votes = _collect_votes(row, ann_cols, ann_field)
-            derived_offensive = None
-            derived_agreement = None
-            if votes:
-                derived_offensive, derived_agreement = _majority_and_agreement(votes)
-
-            offensive = None
-            gold_agreement = None
-            if row.get(gold_col) in (None, ""):
-                print(row)
-            if gold_col and row.get(gold_col) not in (None, ""):
-                gold_raw = str(row[gold_col]).strip()
-                gold_votes = _parse_annotation_sequence(gold_raw)
-                if gold_votes:
-                    if len(gold_votes) != 5:
-                        raise ValueError(
-                            f"Expected 5 annotator labels in '{gold_col}', got {gold_votes}"
-                        )
-                    offensive, gold_agreement = _majority_and_agreement(gold_votes)
-                    if not votes:
-                        derived_offensive, derived_agreement = offensive, gold_agreement
-                else:
-                    offensive = _norm_off(gold_raw)
-
-            if offensive is None and derived_offensive is not None:
-                offensive = derived_offensive
-
-            if offensive is None:
-                raise ValueError("Need gold or annotator labels to derive OFF/NOT.")
-
-            info = lookup_taxonomy(tweet_id, row_split)
-
-            if prefer_taxonomy_agr and info.get("agr"):
-                agreement = info["agr"]
-            elif agr_col and row.get(agr_col) not in (None, ""):
-                agreement = str(row[agr_col]).strip()
-            elif gold_agreement is not None:
-                agreement = gold_agreement
-            elif derived_agreement is not None:
-                agreement = derived_agreement
-            else:
-                agreement = ""
-
-            agr6 = f"{agreement}_{offensive}" if agreement else ""
-
-            main_cat = info.get("primary_cat", "")
-            subtype = info.get("primary_subcat", "")
-            secondary_cat = info.get("secondary_cat", "")
-            secondary_subtype = info.get("secondary_subcat", "")
-
-            columns = [
-                text,
-                offensive,
-                agreement,
-                agr6,
-                main_cat,
-                subtype,
-                secondary_cat,
-                secondary_subtype,
-            ]
-            out_handle.write("\t".join(columns) + "\n")
+    has_gold = (_column(frame, gold_col) != "").to_numpy()
+    gold_raw = _column(frame, gold_col).str.strip()
+    gold_votes = _map_unique(
+        gold_raw, lambda value: _count_off_votes(value, gold_col)
+    ).to_numpy(dtype=np.int8)
+    gold_offensive, gold_agreement = _majority_and_agreement(gold_votes)
+    single_label = has_gold & (gold_votes < 0)
+    gold_offensive[single_label] = _map_unique(
+        gold_raw[single_label], _norm_off
+    ).to_numpy()
+
+    offensive = np.where(has_gold, gold_offensive, derived_offensive)
+    if (offensive == "").any():
+        raise ValueError("Need gold or annotator labels to derive OFF/NOT.")
+
+    if taxonomy:
+        lookup = taxonomy.get
+        records = [
+            lookup(f"{base_id}|{split}") or lookup(base_id) or EMPTY_TAXONOMY
+            for base_id, split in zip(tweet_ids, row_split)
+        ]
+    else:
+        records = [EMPTY_TAXONOMY] * len(frame)
+    info = pd.DataFrame(records, index=frame.index, columns=TAXONOMY_FIELDS)
+
+    agreement = np.where(gold_agreement != "", gold_agreement, derived_agreement)
+    agr_raw = _column(frame, agr_col)
+    agreement = np.where(agr_raw != "", _map_unique(agr_raw, str.strip), agreement)
+    if prefer_taxonomy_agr:
+        agreement = np.where(info["agr"] != "", info["agr"], agreement)
+
+    agreement = pd.Series(agreement, index=frame.index, dtype=object)
+    offensive = pd.Series(offensive, index=frame.index, dtype=object)
+    agr6 = agreement.str.cat(offensive, sep="_").where(agreement != "", "")
+
+    lines = text.str.cat(
+        [
+            offensive,
+            agreement,
+            agr6,
+            info["primary_cat"],
+            info["primary_subcat"],
+            info["secondary_cat"],
+            info["secondary_subcat"],
+        ],
+        sep="\t",
+    )
+    with open(out_path, "w", encoding="utf8", buffering=WRITE_BUFFER) as out_handle:
+        for start in range(0, len(lines), WRITE_BATCH):
+            out_handle.write("\n".join(lines.iloc[start : start + WRITE_BATCH]) + "\n")
 
 
 def main():
@@ -325,45 +390,34 @@ def main():
     taxonomy = load_taxonomy(args.taxonomy_path)
     os.makedirs(args.outdir, exist_ok=True)
 
-    process_split(
-        args.train_csv,
-        os.path.join(args.outdir, "train.tsv"),
-        taxonomy,
-        args.id_col,
-        args.text_col,
-        args.gold_col,
-        args.agr_col,
-        args.ann_cols,
-        args.ann_field,
-        args.prefer_taxonomy_agr,
-        expected_split="train",
-    )
-    process_split(
-        args.dev_csv,
-        os.path.join(args.outdir, "dev.tsv"),
-        taxonomy,
-        args.id_col,
-        args.text_col,
-        args.gold_col,
-        args.agr_col,
-        args.ann_cols,
-        args.ann_field,
-        args.prefer_taxonomy_agr,
-        expected_split="dev",
-    )
-    process_split(
-        args.test_csv,
-        os.path.join(args.outdir, "test.tsv"),
-        taxonomy,
-        args.id_col,
-        args.text_col,
-        args.gold_col,
-        args.agr_col,
-        args.ann_cols,
-        args.ann_field,
-        args.prefer_taxonomy_agr,
-        expected_split="test",
+    convert = functools.partial(
+        process_split,
+        taxonomy=taxonomy,
+        id_col=args.id_col,
+        text_col=args.text_col,
+        gold_col=args.gold_col,
+        agr_col=args.agr_col,
+        ann_cols=args.ann_cols,
+        ann_field=args.ann_field,
+        prefer_taxonomy_agr=args.prefer_taxonomy_agr,
     )
+    splits = [
+        (args.train_csv, "train"),
+        (args.dev_csv, "dev"),
+        (args.test_csv, "test"),
+    ]
+    with ProcessPoolExecutor(max_workers=len(splits)) as executor:
+        futures = [
+            executor.submit(
+                convert,
+                in_path,
+                os.path.join(args.outdir, f"{split}.tsv"),
+                expected_split=split,
+            )
+            for in_path, split in splits
+        ]
+        for future in futures:
+            future.result()
 
 
 if __name__ == "__main__":
@@ -4,32 +4,67 @@
 import argparse
 import glob
 import json
+import mmap
+import os
 from collections import defaultdict
 
 import numpy as np
-from sklearn.metrics import f1_score
+
+
+def _decode_all(values):
+    """Decode byte strings, decoding each distinct value only once."""
+    decoded = {value: value.decode("utf8") for value in set(values)}
+    return [decoded[value] for value in values]
 
 
 def read_split(tsv_path):
-    rows = []
-    with open(tsv_path, encoding="utf8") as handle:
-        for line in handle:
-            parts = line.rstrip("\n").split("\t")
-            if len(parts) < 2:
-                continue
-            rows.append(parts)
-    return rows
+    """Return the gold label, category and subtype columns of a split TSV."""
+    gold, categories, subtypes = [], [], []
+    with open(tsv_path, "rb") as handle:
+        if os.fstat(handle.fileno()).st_size == 0:
+            return gold, categories, subtypes
+        with mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            for line in iter(data.readline, b""):
+                parts = line.rstrip(b"\r\n").split(b"\t")
+                if len(parts) < 2:
+                    continue
+                gold.append(parts[1])
+                categories.append(parts[4] if len(parts) > 4 else b"")
+                subtypes.append(parts[5] if len(parts) > 5 else b"")
+    return _decode_all(gold), _decode_all(categories), _decode_all(subtypes)
 
 
 def read_preds(pred_path):
     with open(pred_path, encoding="utf8") as handle:
-        return [line.strip() for line in handle]
+        return handle.read().splitlines()
+
+
+def encode_labels(labels):
+    """Encode OFF/NOT labels as an int8 array (1=OFF, 0=NOT)."""
+    labels = np.asarray(labels, dtype=object)
+    codes = np.full(len(labels), -1, dtype=np.int8)
+    codes[labels == "OFF"] = 1
+    codes[labels == "NOT"] = 0
+    if (codes < 0).any():
+        unknown = sorted(set(labels[codes < 0]))
+        raise ValueError(f"Unrecognized labels: {unknown}")
+    return codes
+
+
+def _f1(tp, fp, fn):
+    denominator = 2 * tp + fp + fn
+    return 2 * tp / denominator if denominator else 0.0
 
 
 def f1s(y_true, y_pred):
-    overall = f1_score(y_true, y_pred, average="micro", labels=["OFF", "NOT"])
-    off_f1 = f1_score(y_true, y_pred, pos_label="OFF")
-    not_f1 = f1_score(y_true, y_pred, pos_label="NOT")
+    """Return micro, OFF and NOT F1 for labels encoded by ``encode_labels``."""
+    off_tp = int(np.count_nonzero(y_true & y_pred))
+    not_tp = int(np.count_nonzero((y_true | y_pred) == 0))
+    off_fn = int(np.count_nonzero(y_true > y_pred))
+    off_fp = int(np.count_nonzero(y_true < y_pred))
+    overall = _f1(off_tp + not_tp, off_fp + off_fn, off_fn + off_fp)
+    off_f1 = _f1(off_tp, off_fp, off_fn)
+    not_f1 = _f1(not_tp, off_fn, off_fp)
     return overall, off_f1, not_f1
 
 
@@ -50,10 +85,8 @@ def main():
     parser.add_argument("--out_json", required=True)
     args = parser.parse_args()
 
-    test_rows = read_split(args.test_tsv)
-    gold = [row[1] for row in test_rows]
-    categories = [row[4] if len(row) > 4 else "" for row in test_rows]
-    subtypes = [row[5] if len(row) > 5 else "" for row in test_rows]
+    gold, categories, subtypes = read_split(args.test_tsv)
+    gold_codes = encode_labels(gold)
 
     groups = {"__ALL__": list(range(len(gold)))}
     if args.group_by == "category":
@@ -67,20 +100,28 @@ def main():
             if subtype:
                 groups[subtype].append(idx)
 
+    group_idx = {
+        name: np.fromiter(indices, dtype=np.int64, count=len(indices))
+        for name, indices in groups.items()
+        if indices
+    }
+    gold_sub = {name: gold_codes[idx] for name, idx in group_idx.items()}
+
+    pred_paths = sorted(glob.glob(args.pred_glob))
+    if not pred_paths:
+        raise ValueError("No prediction files matched the provided glob.")
+
     runs = []
-    for pred_path in sorted(glob.glob(args.pred_glob)):
+    for pred_path in pred_paths:
         preds = read_preds(pred_path)
         if len(preds) != len(gold):
             raise ValueError(
                 f"Prediction length mismatch: {pred_path} has {len(preds)} items but gold has {len(gold)}"
             )
+        pred_codes = encode_labels(preds)
         per_group = {}
-        for group_name, indices in groups.items():
-            if not indices:
-                continue
-            gold_subset = [gold[i] for i in indices]
-            pred_subset = [preds[i] for i in indices]
-            overall, off_f1, not_f1 = f1s(gold_subset, pred_subset)
+        for group_name, idx in group_idx.items():
+            overall, off_f1, not_f1 = f1s(gold_sub[group_name], pred_codes[idx])
             per_group[group_name] = {
                 "ALL": overall,
                 "OFF": off_f1,
@@ -88,9 +129,6 @@ def main():
             }
         runs.append(per_group)
 
-    if not runs:
-        raise ValueError("No prediction files matched the provided glob.")
-
     aggregated = {}
     for group_name in runs[0]:
         for metric in ["ALL", "OFF", "NOT"]: